@@ -0,0 +1,37 @@
+import os
+import pandas as pd
+
+
+def parquet_path(path):
+    return os.path.splitext(path)[0] + '.parquet'
+
+def _kwargs_key(read_kwargs):
+    return repr(sorted(read_kwargs.items()))
+
+def load_cached(path, **read_kwargs):
+    """
+    读取Excel文件；首次读取后在同目录写入同名parquet副本，
+    之后只要副本不旧于原文件、且是按相同的read_kwargs解析的，就直接读parquet，省去openpyxl解析。
+    """
+    cache_path = parquet_path(path)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        df = pd.read_parquet(cache_path)
+        if df.attrs.pop('read_kwargs', None) == _kwargs_key(read_kwargs):
+            return df
+    df = pd.read_excel(path, **read_kwargs)
+    save_parquet_twin(df, path, read_kwargs)
+    return df
+
+def save_parquet_twin(df, path, read_kwargs=None):
+    """
+    写入与Excel同名的parquet副本。副本保存的是df本身，
+    写Excel时用了float_format等格式参数的，调用方应先把df处理成与表格一致再传入。
+    """
+    # parquet副本仅作加速用，写入失败（如缺少pyarrow、列类型混杂）不影响主流程
+    try:
+        twin = df.copy(deep=False)
+        # 记录副本对应的读取参数，参数不同的读取方不会误用这份副本
+        twin.attrs['read_kwargs'] = _kwargs_key(read_kwargs or {})
+        twin.to_parquet(parquet_path(path), index=False, compression='zstd')
+    except Exception as e:
+        print(f"提示: 未能写入parquet副本 {parquet_path(path)}: {e}")
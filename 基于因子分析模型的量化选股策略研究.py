@@ -2,11 +2,20 @@ import os
 import pandas as pd
 import numpy as np
 import re
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import FactorAnalysis
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import matplotlib
+matplotlib.use('Agg')  # 子进程中出图，不打开GUI窗口
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pandas.plotting import table
+from parquet_cache import load_cached, save_parquet_twin
+
+try:
+    from numba import njit
+except ImportError:  # 未安装numba时退化为普通numpy实现
+    def njit(*args, **kwargs):
+        return args[0] if args and callable(args[0]) else (lambda func: func)
 
 # ==============================================================================
 # --- 1. 全局配置区 ---
@@ -22,47 +31,101 @@ TOP_N_STOCKS = 5
 
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['axes.unicode_minus'] = False
+plt.rcParams['path.simplify_threshold'] = 1.0  # 折线最大程度简化，加快渲染
+
+# 列名中第一个换行符及其后的全部内容（报告期、单位等）
+_NEWLINE_REST = re.compile(r'\n.*', re.DOTALL)
 
 # ==============================================================================
 # --- 2. 核心功能函数 ---
 # ==============================================================================
 
+@njit(cache=True)
+def _varimax(loadings: np.ndarray, tol: float = 1e-6, max_iter: int = 100) -> np.ndarray:
+    """对载荷矩阵（变量×因子）做Kaiser varimax正交旋转，算法同sklearn"""
+    n_rows, n_cols = loadings.shape
+    rotation = np.eye(n_cols, dtype=loadings.dtype)
+    var = 0
+    for _ in range(max_iter):
+        rotated = loadings @ rotation
+        tmp = rotated * (np.sum(rotated**2, axis=0) / n_rows)
+        u, s, vt = np.linalg.svd(loadings.T @ (rotated**3 - tmp))
+        rotation = u @ vt
+        var_new = np.sum(s)
+        if var != 0 and var_new < var * (1 + tol):
+            break
+        var = var_new
+    return loadings @ rotation
+
+@njit(cache=True)
+def _score_kernel(features: np.ndarray, min_cum_var: float, max_factor: int):
+    """
+    标准化 -> SVD主成分 -> varimax旋转 -> 加权综合得分，一次完成。
+    features 为不含缺失值的 样本×变量 矩阵；返回 (综合得分, 旋转后的载荷矩阵)。
+    """
+    n_samples, n_variables = features.shape
+    fit_factor = min(max_factor, n_variables)
+
+    # 标准化（总体标准差，同StandardScaler；零方差列得分为0）
+    mean = np.sum(features, axis=0) / n_samples
+    centered = features - mean
+    std = np.sqrt(np.sum(centered**2, axis=0) / n_samples)
+    std[std == 0] = 1.0
+    features_scaled = centered / std
+
+    # 用SVD做主成分近似代替EM迭代的因子分析，仅用于排序时偏差可忽略
+    _, sing_vals, vt = np.linalg.svd(features_scaled, full_matrices=False)
+    contrib_ratio = sing_vals**2 / np.sum(sing_vals**2)
+    cumsum = np.cumsum(contrib_ratio)
+    n_factors = min(np.searchsorted(cumsum, min_cum_var) + 1, fit_factor)  # 满足累计贡献率的最小个数
+    # 载荷矩阵（变量×因子），按样本数缩放后即为变量与因子的相关系数
+    loadings = np.ascontiguousarray(vt[:n_factors].T) * sing_vals[:n_factors] / np.sqrt(n_samples)
+    loadings = loadings.astype(features.dtype)  # 保持与输入相同的精度（float32）
+    # 保留全部因子时没有可简化的结构，varimax的最优解不唯一、随舍入误差跳变，此时不旋转
+    if n_factors < n_variables:
+        loadings = _varimax(loadings)
+    # SVD结果的正负号不唯一（随精度/LAPACK实现而变），统一为载荷之和为正，保证排序稳定；
+    # 载荷之和接近0时（如两个变量的第二主成分）正负号由舍入决定，改按第一个明显非零的载荷为正
+    sums = np.sum(loadings, axis=0)
+    scale = np.sum(np.abs(loadings), axis=0) * 1e-3
+    signs = np.sign(sums)
+    for j in range(n_factors):
+        if abs(sums[j]) <= scale[j]:
+            signs[j] = 1
+            for i in range(n_variables):
+                if abs(loadings[i, j]) > scale[j]:
+                    signs[j] = np.sign(loadings[i, j])
+                    break
+    signs[signs == 0] = 1
+    loadings = loadings * signs
+    factor_scores = features_scaled @ loadings @ np.linalg.pinv(loadings.T @ loadings)
+    eig_vals = np.sum(loadings**2, axis=0)
+    weights = eig_vals / np.sum(eig_vals)
+    return factor_scores @ weights, loadings
+
 def rolling_factor_analysis_and_ranking(window_data: pd.DataFrame, min_cum_var: float = 0.8, max_factor: int = 10):
     # max_factor 可根据变量/经验选合适上限
     stock_info = window_data[['证券名称']].copy()
     features = window_data.drop(columns=['证券名称'])
-    n_variables = features.shape[1]
-    fit_factor = min(max_factor, n_variables)
-
-    scaler = StandardScaler()
-    features_scaled = np.nan_to_num(scaler.fit_transform(features))
-    
-    # 先最多做 max_factor 个
-    fa = FactorAnalysis(n_components=fit_factor, rotation='varimax', random_state=0)
     try:
-        factor_scores = fa.fit_transform(features_scaled)
-        eig_vals = np.sum(fa.components_**2, axis=1)
-        contrib_ratio = eig_vals / np.sum(eig_vals)
-        cumsum = np.cumsum(contrib_ratio)
-        n_factors = np.searchsorted(cumsum, min_cum_var) + 1  # 满足累计贡献率的最小个数
-        # 最终再fit一次
-        fa = FactorAnalysis(n_components=n_factors, rotation='varimax', random_state=0)
-        factor_scores = fa.fit_transform(features_scaled)
-        eig_vals = np.sum(fa.components_**2, axis=1)
-        weights = eig_vals / np.sum(eig_vals)
+        total_scores, loadings = _score_kernel(features.to_numpy(dtype=np.float32), min_cum_var, max_factor)
     except Exception:
         return None, None
 
-    total_scores = np.dot(factor_scores, weights)
-    loadings_df = pd.DataFrame(fa.components_.T, index=features.columns,
-                               columns=[f'因子{i+1}' for i in range(n_factors)])
+    loadings_df = pd.DataFrame(loadings, index=features.columns,
+                               columns=[f'因子{i+1}' for i in range(loadings.shape[1])])
     ranked_stocks = stock_info.copy()
     ranked_stocks['综合得分'] = total_scores
     ranked_stocks.sort_values(by='综合得分', ascending=False, inplace=True)
     return loadings_df, ranked_stocks.reset_index(drop=True)
 
+def _holdings_value(price_row: np.ndarray, holding_cols: np.ndarray, holding_shares: np.ndarray) -> float:
+    """按某一交易日的股价行计算持仓市值（股价已前向填充），从未有过股价的按0计"""
+    return float(holding_shares @ np.nan_to_num(price_row[holding_cols]))
+
+@lru_cache(maxsize=None)
 def get_base_indicator_name(column_name):
-    return re.sub(r'\n.*', '', column_name, flags=re.DOTALL).strip()
+    return _NEWLINE_REST.sub('', column_name).strip()
 
 def backtest_and_analyze(industry_name: str, fundamental_df: pd.DataFrame, price_df: pd.DataFrame = None):
     print(f"\n{'='*25} 开始处理【{industry_name}】行业 {'='*25}")
@@ -77,56 +140,65 @@ def backtest_and_analyze(industry_name: str, fundamental_df: pd.DataFrame, price
             price_ts = price_df.copy()
             price_ts['日期'] = pd.to_datetime(price_ts['日期'])
             price_ts.set_index('日期', inplace=True)
-            price_ts.sort_index(inplace=True)
+            # 股价整理表为最新日期在上：倒序时直接翻转，已升序时跳过，其余情况才完整排序
+            if price_ts.index.is_monotonic_decreasing:
+                price_ts = price_ts.iloc[::-1]
+            elif not price_ts.index.is_monotonic_increasing:
+                price_ts.sort_index(inplace=True)
+            # 回测热路径只用稠密数组：日期×股票的float32价格矩阵，外加 股票名称 -> 列号
+            name_to_col = {name: j for j, name in enumerate(price_ts.columns)}
+            # 当天有正股价才可买入；持仓估值则按最近一次已知股价计，停牌不会把持仓记成0
+            tradable_arr = price_ts.to_numpy(dtype=np.float32) > 0
+            price_arr = price_ts.ffill().to_numpy(dtype=np.float32)
+            date_index = price_ts.index.values  # 已排序，供searchsorted二分查找
         except Exception as e:
             print(f"    - 警告: 股价数据预处理失败: {e}。将仅执行因子分析。")
             price_ts = None
 
     # 回测变量
-    current_portfolio = {}
+    # 持仓以两个平行数组保存：股价矩阵中的列号、持有股数
+    holding_cols, holding_shares = np.array([], dtype=np.intp), np.array([])
     cash = INITIAL_CAPITAL
     quarters = pd.to_datetime(pd.date_range(start=BACKTEST_START_DATE, end=BACKTEST_END_DATE, freq='QS-JAN'))
 
+    # 预先解析每个财务列对应的报告期末日期，季度循环内只需做布尔筛选
+    report_map = {"一季": "03", "中报": "06", "三季": "09", "年报": "12"}
+    data_cols = pd.Series(fundamental_df.columns[1:])  # 跳过“证券名称”
+    extracted = data_cols.str.replace('\n', ' ').str.extract(r'(\d{4}).*?(一季|中报|三季|年报)')
+    report_dates = pd.to_datetime(extracted[0] + '-' + extracted[1].map(report_map), format='%Y-%m') + pd.offsets.MonthEnd(0)
+
+    # 列名固定不变，列 -> 基础指标的映射只需建立一次
+    dated_cols = data_cols[report_dates.notna()]
+    col_to_indicator = pd.Series([get_base_indicator_name(col) for col in dated_cols], index=dated_cols.values)
+
     for i, trade_date in enumerate(quarters):
         quarter_str = f"{trade_date.year}Q{trade_date.quarter}"
         print(f"\n--- 季度: {quarter_str} ---")
 
         # --- 1. 期初资产 ---
         if price_ts is not None:
-            try:
-                actual_trade_date = price_ts.index[price_ts.index >= trade_date][0]
-                prices_on_trade_date = price_ts.loc[actual_trade_date]
-            except IndexError:
+            row_idx = date_index.searchsorted(np.datetime64(trade_date))
+            if row_idx == len(date_index):
                 print(f"    - 警告: 找不到 {trade_date.date()} 或之后的股价，无法交易。")
                 continue
+            prices_on_trade_date = price_arr[row_idx]
 
             if i == 0:
                 total_asset_value = INITIAL_CAPITAL
             else:
-                stock_value = sum(shares * prices_on_trade_date.get(name, 0) for name, shares in current_portfolio.items())
+                stock_value = _holdings_value(prices_on_trade_date, holding_cols, holding_shares)
                 total_asset_value = stock_value + cash
             
             portfolio_history[quarter_str] = {'start_asset': total_asset_value}
             print(f"    - 期初总资产: {total_asset_value:,.2f}")
             cash = total_asset_value
-            current_portfolio = {}
+            holding_cols, holding_shares = np.array([], dtype=np.intp), np.array([])
 
         # --- 2. 因子分析与选股 ---
         t2 = trade_date - pd.DateOffset(months=6)
         t5 = t2 - pd.DateOffset(months=9)
         
-        window_cols = []
-        report_map = {"一季": 3, "中报": 6, "三季": 9, "年报": 12}
-        for col in fundamental_df.columns[1:]:  # 跳过“证券名称”
-            clean_col = col.replace('\n', ' ')
-            match = re.search(r'(\d{4}).*?(一季|中报|三季|年报)', clean_col)
-            if match:
-                year, report_type = match.groups()
-                month = report_map.get(report_type)
-                if year and month:
-                    report_date = pd.to_datetime(f'{year}-{month}-01') + pd.offsets.MonthEnd(0)
-                    if t5 <= report_date <= t2:
-                        window_cols.append(col)
+        window_cols = data_cols[(report_dates >= t5) & (report_dates <= t2)].tolist()
 
         if not window_cols:
             print("    - 警告: 找不到足够的财务数据，跳过本季度。")
@@ -136,12 +208,12 @@ def backtest_and_analyze(industry_name: str, fundamental_df: pd.DataFrame, price
         window_df = fundamental_df[base_cols + window_cols].copy()
         for col in window_cols:
             window_df[col] = pd.to_numeric(window_df[col], errors='coerce')
+        # 财务指标精度远低于float64，降为float32可减半后续计算的内存带宽
+        window_df[window_cols] = window_df[window_cols].astype(np.float32)
         
-        mean_df = window_df[base_cols].copy()
-        base_indicators = {get_base_indicator_name(col) for col in window_cols}
-        for indicator in sorted(list(base_indicators)):
-            cols_for_mean = [col for col in window_cols if get_base_indicator_name(col) == indicator]
-            mean_df[indicator] = window_df[cols_for_mean].mean(axis=1)
+        # 同一基础指标的各期数据一次性分组求均值
+        indicator_means = window_df[window_cols].T.groupby(col_to_indicator[window_cols]).mean().T
+        mean_df = pd.concat([window_df[base_cols], indicator_means], axis=1)
 
         loadings, ranked_stocks = rolling_factor_analysis_and_ranking(mean_df.dropna())
 
@@ -157,23 +229,15 @@ def backtest_and_analyze(industry_name: str, fundamental_df: pd.DataFrame, price
         if price_ts is not None:
             if trade_date != quarters[-1]:
                 target_names = all_top_stocks[quarter_str]['证券名称'].tolist()
-                tradable_names = [name for name in target_names
-                                  if name in prices_on_trade_date.index or name in prices_on_trade_date.index.tolist() or name in prices_on_trade_date.keys()]
-                tradable_names = [name for name in target_names
-                                  if name in prices_on_trade_date.index or name in prices_on_trade_date.keys()]
-                # 保险：用keys()兼容Series类型
-                tradable_names = [name for name in target_names
-                                  if name in prices_on_trade_date.index or name in prices_on_trade_date.keys()]
-                # 并且价格不为nan且大于0
-                tradable_names = [name for name in tradable_names
-                                  if pd.notna(prices_on_trade_date.get(name, np.nan)) and prices_on_trade_date.get(name, 0) > 0]
-                if tradable_names:
-                    investment_per_stock = cash / len(tradable_names)
-                    for name in tradable_names:
-                        price = prices_on_trade_date.get(name, np.nan)
-                        shares = investment_per_stock / price
-                        current_portfolio[name] = shares
-                        cash -= investment_per_stock
+                # 只有在股价表中、且价格不为nan且大于0的股票才可交易
+                target_cols = np.array([name_to_col[name] for name in target_names if name in name_to_col], dtype=np.intp)
+                prices = prices_on_trade_date[target_cols].astype(np.float64)
+                tradable = tradable_arr[row_idx, target_cols]
+                if tradable.any():
+                    holding_cols = target_cols[tradable]
+                    investment_per_stock = cash / len(holding_cols)
+                    holding_shares = investment_per_stock / prices[tradable]
+                    cash -= investment_per_stock * len(holding_cols)
                     print(f"    - 建立新持仓后，剩余现金: {cash:,.2f}")
                 else:
                     print("    - 警告: 目标股票均无法交易，本季度空仓。")
@@ -182,10 +246,10 @@ def backtest_and_analyze(industry_name: str, fundamental_df: pd.DataFrame, price
     if price_ts is not None and portfolio_history:
         last_q_str = f"{quarters[-1].year}Q{quarters[-1].quarter}"
         final_asset_value = cash
-        if current_portfolio:
+        if len(holding_cols):
             try:
-                final_prices = price_ts.iloc[-1]
-                final_proceeds = sum(shares * final_prices.get(name, 0) for name, shares in current_portfolio.items())
+                final_prices = price_arr[-1]
+                final_proceeds = _holdings_value(final_prices, holding_cols, holding_shares)
                 final_asset_value = cash + final_proceeds
             except IndexError:
                 pass
@@ -196,7 +260,27 @@ def backtest_and_analyze(industry_name: str, fundamental_df: pd.DataFrame, price
 
     return all_loadings, all_top_stocks, portfolio_history
 
-def generate_visualizations(industry_name: str, loadings: dict, top_stocks: dict, history: dict):
+def _render_year_heatmap(industry_name: str, year: str, year_loadings: dict, output_dir: str):
+    """绘制并保存某一年各季度的因子载荷矩阵热力图"""
+    fig, axes = plt.subplots(1, len(year_loadings), figsize=(5 * len(year_loadings), 8), squeeze=False)
+    fig.suptitle(f'【{industry_name}】{year}年 因子载荷矩阵', fontsize=16)
+    for i, (q, df) in enumerate(year_loadings.items()):
+        sns.heatmap(df, ax=axes[0, i], cmap='viridis', annot=True, fmt=".2f")
+        axes[0, i].set_title(q)
+    plt.tight_layout(rect=[0, 0.03, 1, 0.95])
+    plt.savefig(os.path.join(output_dir, f"{industry_name}_{year}年_因子载荷矩阵.png"))
+    plt.close(fig)
+
+def _render_year_heatmap_in_worker(*args):
+    """joblib子进程入口：子进程不一定执行过模块顶部的全局配置，先补上后端和中文字体"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.rcParams['font.sans-serif'] = ['SimHei']
+    plt.rcParams['axes.unicode_minus'] = False
+    _render_year_heatmap(*args)
+
+def generate_visualizations(industry_name: str, loadings: dict, top_stocks: dict, history: dict, n_jobs: int = -1):
     print(f"\n--- 为【{industry_name}】生成图表 ---")
     output_dir = os.path.join(os.getcwd(), OUTPUT_PROJECT_NAME)
     os.makedirs(output_dir, exist_ok=True)
@@ -208,27 +292,28 @@ def generate_visualizations(industry_name: str, loadings: dict, top_stocks: dict
         history_df['期末总资产'] = [history[q].get('end_asset') for q in history_df['季度']]
         history_df = history_df[['季度', '期初总资产', '期末总资产', '季度收益率(%)']]
         excel_path = os.path.join(output_dir, f"{industry_name}_收益回测明细.xlsx")
-        history_df.to_excel(excel_path, index=False, float_format="%.2f")
+        history_df.to_excel(excel_path, index=False, float_format="%.2f", engine="xlsxwriter")
+        save_parquet_twin(history_df.round(2), excel_path)  # 与表格的两位小数保持一致
         print(f"  - 已保存收益回测明细: {excel_path}")
 
-    # 2. 因子载荷矩阵
+    # 2. 因子载荷矩阵（各年份的图互不依赖，可并行渲染；已在进程池内时传n_jobs=1串行，避免嵌套开进程）
     if loadings:
-        for year in sorted({q[:4] for q in loadings.keys()}):
-            quarters_in_year = [q for q in loadings if q.startswith(year)]
-            fig, axes = plt.subplots(1, len(quarters_in_year), figsize=(5 * len(quarters_in_year), 8), squeeze=False)
-            fig.suptitle(f'【{industry_name}】{year}年 因子载荷矩阵', fontsize=16)
-            for i, q in enumerate(quarters_in_year):
-                sns.heatmap(loadings[q], ax=axes[0, i], cmap='viridis', annot=True, fmt=".2f")
-                axes[0, i].set_title(q)
-            plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-            plt.savefig(os.path.join(output_dir, f"{industry_name}_{year}年_因子载荷矩阵.png"))
-            plt.close(fig)
+        years = sorted({q[:4] for q in loadings.keys()})
+        tasks = [(industry_name, year, {q: df for q, df in loadings.items() if q.startswith(year)}, output_dir) for year in years]
+        if n_jobs == 1:
+            for task in tasks:
+                _render_year_heatmap(*task)
+        else:
+            from joblib import Parallel, delayed  # 只有并行出图时才需要joblib
+            Parallel(n_jobs=n_jobs, backend='loky')(delayed(_render_year_heatmap_in_worker)(*task) for task in tasks)
         print(f"  - 已保存因子载荷矩阵图。")
 
     # 3. 选股策略
     if top_stocks:
         result_df = pd.concat([df.assign(季度=q) for q, df in top_stocks.items()])[['季度', '证券名称', '综合得分']]
-        result_df.to_excel(os.path.join(output_dir, f"{industry_name}_每季度选股策略.xlsx"), index=False)
+        top_stocks_path = os.path.join(output_dir, f"{industry_name}_每季度选股策略.xlsx")
+        result_df.to_excel(top_stocks_path, index=False, engine="xlsxwriter")
+        save_parquet_twin(result_df, top_stocks_path)
         fig, ax = plt.subplots(figsize=(12, max(5, 0.4 * len(result_df))))
         ax.axis('off'); ax.set_title(f'【{industry_name}】每季度选股策略 (Top {TOP_N_STOCKS})', fontsize=16, pad=20)
         tbl = table(ax, result_df, loc='center', cellLoc='center', colWidths=[0.15, 0.2, 0.2])
@@ -266,7 +351,7 @@ def plot_multi_industry_nav_comparison(output_project_folder, initial_capital=IN
     legend = []
     for i, path in enumerate(files):
         try:
-            df = pd.read_excel(path)
+            df = load_cached(path)
             industry = os.path.basename(path).replace("_收益回测明细.xlsx", "")
             # 用期初总资产为净值
             dates = df['季度']
@@ -291,33 +376,43 @@ def plot_multi_industry_nav_comparison(output_project_folder, initial_capital=IN
 
 
     
+def _process_industry(task):
+    """单个行业的完整流程（读取、回测、出图），各行业互相独立，供进程池并行调用"""
+    industry_name, fundamental_file_path, price_file_path = task
+    try:
+        fundamental_df = load_cached(fundamental_file_path)
+    except Exception as e:
+        print(f"读取文件 {os.path.basename(fundamental_file_path)} 失败: {e}"); return
+
+    price_df = None
+    if os.path.exists(price_file_path):
+        try:
+            price_df = load_cached(price_file_path)
+            print(f"成功加载【{industry_name}】的股价数据。")
+        except Exception as e:
+            print(f"警告: 读取股价文件 {price_file_path} 失败: {e}")
+    else:
+        print(f"提示: 未找到【{industry_name}】的股价数据文件。")
+
+    loadings, top_stocks, history = backtest_and_analyze(industry_name, fundamental_df, price_df)
+    # 本函数已运行在进程池的工作进程中，出图不再另开joblib子进程
+    generate_visualizations(industry_name, loadings, top_stocks, history, n_jobs=1)
+
 def main():
     if not os.path.isdir(FUNDAMENTAL_DATA_DIR):
         print(f"错误: 财务数据文件夹 '{FUNDAMENTAL_DATA_DIR}' 不存在。"); return
 
+    tasks = []
     for filename in os.listdir(FUNDAMENTAL_DATA_DIR):
         if filename.endswith("_清洗后.xlsx") and not filename.startswith("~"):
             industry_name = filename.replace("_清洗后.xlsx", "")
             fundamental_file_path = os.path.join(FUNDAMENTAL_DATA_DIR, filename)
             price_file_path = os.path.join(PRICE_DATA_DIR, f"{industry_name}_股价整理.xlsx")
-            
-            try:
-                fundamental_df = pd.read_excel(fundamental_file_path)
-            except Exception as e:
-                print(f"读取文件 {filename} 失败: {e}"); continue
-            
-            price_df = None
-            if os.path.exists(price_file_path):
-                try:
-                    price_df = pd.read_excel(price_file_path)
-                    print(f"成功加载【{industry_name}】的股价数据。")
-                except Exception as e:
-                    print(f"警告: 读取股价文件 {price_file_path} 失败: {e}")
-            else:
-                print(f"提示: 未找到【{industry_name}】的股价数据文件。")
+            tasks.append((industry_name, fundamental_file_path, price_file_path))
 
-            loadings, top_stocks, history = backtest_and_analyze(industry_name, fundamental_df, price_df)
-            generate_visualizations(industry_name, loadings, top_stocks, history)
+    # 各行业计算量大且互不依赖，用多进程并行处理
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        list(ex.map(_process_industry, tasks))
 
     plot_multi_industry_nav_comparison(OUTPUT_PROJECT_NAME)
 
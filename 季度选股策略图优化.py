@@ -1,6 +1,10 @@
 import pandas as pd
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # 只输出图片文件，不需要GUI后端
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.collections import PatchCollection
 import os
 
 # ==============================================================================
@@ -31,6 +35,7 @@ def draw_custom_table(ax, data, year_title):
     # --- 表格参数 ---
     header = data.columns
     col_widths = [0.15, 0.55, 0.3]  # 列宽比例: 季度, 股票名称, 综合得分
+    x_offsets = np.concatenate([[0], np.cumsum(col_widths)[:-1]])  # 各列左边界
     row_height = 0.08
     header_color = '#E0E6F1'
     row_color_even = '#F7F7F7'
@@ -38,12 +43,16 @@ def draw_custom_table(ax, data, year_title):
     font_size_header = 14
     font_size_data = 13
     
+    # 背景矩形先收集起来，最后作为一个PatchCollection一次性绘制
+    rects, colors = [], []
+
     # --- 绘制表头 ---
     y_pos = 0.9
     for i, (col, width) in enumerate(zip(header, col_widths)):
-        x_pos = sum(col_widths[:i])
+        x_pos = x_offsets[i]
         # 绘制表头背景
-        ax.add_patch(patches.Rectangle((x_pos, y_pos - row_height), width, row_height, facecolor=header_color, edgecolor='none'))
+        rects.append(patches.Rectangle((x_pos, y_pos - row_height), width, row_height))
+        colors.append(header_color)
         # 打印表头文字
         ax.text(x_pos + width / 2, y_pos - row_height / 2, col, ha='center', va='center', fontsize=font_size_header, weight='bold')
 
@@ -52,15 +61,19 @@ def draw_custom_table(ax, data, year_title):
     for row_idx, row_data in enumerate(data.itertuples(index=False)):
         bg_color = row_color_even if row_idx % 2 == 0 else row_color_odd
         for i, (cell_data, width) in enumerate(zip(row_data, col_widths)):
-            x_pos = sum(col_widths[:i])
+            x_pos = x_offsets[i]
             # 绘制数据行背景
-            ax.add_patch(patches.Rectangle((x_pos, y_pos - row_height), width, row_height, facecolor=bg_color, edgecolor='none'))
+            rects.append(patches.Rectangle((x_pos, y_pos - row_height), width, row_height))
+            colors.append(bg_color)
             # 打印数据文字
             ha = 'left' if i == 1 else 'center' # 股票名称左对齐，其他居中
             text_x = x_pos + 0.02 if i == 1 else x_pos + width / 2
             ax.text(text_x, y_pos - row_height / 2, str(cell_data), ha=ha, va='center', fontsize=font_size_data)
         y_pos -= row_height
 
+    # autolim=False：与逐个add_patch时一致，不改变子图的坐标范围
+    ax.add_collection(PatchCollection(rects, facecolors=colors, edgecolors='none'), autolim=False)
+
 
 def create_pixel_perfect_grid(input_path: str, output_path: str, title: str):
     """
@@ -1,8 +1,8 @@
 import os
 import pandas as pd
-from collections import Counter
 import matplotlib.pyplot as plt
 from matplotlib.font_manager import FontManager
+from parquet_cache import load_cached
 
 def set_chinese_font():
     """
@@ -93,37 +93,34 @@ def analyze_stocks_by_industry(base_path):
     print(f"图表输出目录: {os.path.abspath(plot_output_dir)}")
 
     # 4. 读取和汇总数据
-    industry_stocks = {}
+    industry_series = {}
     for filename in os.listdir(input_dir):
         if filename.endswith(('.xlsx', '.xls')):
             try:
                 industry_name = filename.split('_')[0]
                 file_path = os.path.join(input_dir, filename)
                 print(f"正在处理文件: {filename}，行业: {industry_name}")
-                df = pd.read_excel(file_path)
+                df = load_cached(file_path)
 
                 if '证券名称' in df.columns:
-                    if industry_name not in industry_stocks:
-                        industry_stocks[industry_name] = []
-                    industry_stocks[industry_name].extend(df['证券名称'].dropna().tolist())
+                    industry_series.setdefault(industry_name, []).append(df['证券名称'].dropna())
                 else:
                     print(f"警告：文件 '{filename}' 中未找到 '证券名称' 列。")
             except Exception as e:
                 print(f"处理文件 '{filename}' 时出错: {e}")
 
     # 5. 处理每个行业的数据
-    if not industry_stocks:
+    if not industry_series:
         print("未找到任何股票数据进行处理。")
         return
 
     # 设置中文字体
     set_chinese_font()
 
-    for industry, stocks in industry_stocks.items():
-        # 统计频率
-        stock_counts = Counter(stocks)
-        result_df = pd.DataFrame(stock_counts.items(), columns=['证券名称', '出现次数'])
-        result_df = result_df.sort_values(by='出现次数', ascending=False).reset_index(drop=True)
+    for industry, parts in industry_series.items():
+        # 统计频率（value_counts已按出现次数降序排列）
+        stock_counts = pd.concat(parts, ignore_index=True).value_counts()
+        result_df = stock_counts.rename_axis('证券名称').reset_index(name='出现次数')
         
         # --- 保存Excel文件 ---
         excel_filename = f"{industry}_涉及的股票.xlsx"
@@ -1,6 +1,8 @@
 import os
 import pandas as pd
 import re
+from functools import lru_cache
+from parquet_cache import load_cached, save_parquet_twin
 
 # --- 参数配置 ---
 # 输入和输出文件夹名称
@@ -13,7 +15,11 @@ INDICATOR_DROP_THRESHOLD = 0.8
 # 2. 个股行删除阈值：在删除了无用指标后，如果一只股票的所有剩余数据点中，有超过50%是缺失的，则剔除该股票
 STOCK_DROP_THRESHOLD = 0.5
 
+# 列名中第一个换行符及其后的全部内容（报告期、单位等）
+_NEWLINE_REST = re.compile(r'\n.*', re.DOTALL)
 
+
+@lru_cache(maxsize=None)
 def get_base_indicator_name(column_name):
     """
     从复杂的列名中提取基础指标名称。
@@ -21,11 +27,8 @@ def get_base_indicator_name(column_name):
     """
     if column_name in ["证券代码", "证券名称"]:
         return column_name
-    # 移除换行符和方括号内的所有内容
-    base_name = re.sub(r'\n\[.*?\]', '', column_name, flags=re.DOTALL)
-    # 移除末尾的单位信息等
-    base_name = re.sub(r'\n.*', '', base_name)
-    return base_name.strip()
+    # 移除第一个换行符之后的报告期、单位等信息
+    return _NEWLINE_REST.sub('', column_name).strip()
 
 def clean_data(file_path):
     """
@@ -35,7 +38,7 @@ def clean_data(file_path):
 
     # 读取数据，并将 "--" 视为空值
     try:
-        df = pd.read_excel(file_path, na_values="--")
+        df = load_cached(file_path, na_values="--")
     except FileNotFoundError:
         print(f"错误: 文件未找到 {file_path}")
         return None
@@ -52,26 +55,14 @@ def clean_data(file_path):
     
     # 提取所有数据列的基础指标名称
     data_columns = df.columns[2:]
-    base_indicator_map = {col: get_base_indicator_name(col) for col in data_columns}
-    unique_indicators = sorted(list(set(base_indicator_map.values())))
-    
-    cols_to_drop = []
-    for indicator in unique_indicators:
-        # 找到属于当前基础指标的所有列
-        indicator_cols = [col for col, base_name in base_indicator_map.items() if base_name == indicator]
-        
-        # 提取这个指标的数据块
-        indicator_block = df[indicator_cols]
-        
-        # 计算整个块的缺失率
-        total_cells = indicator_block.size
-        missing_cells = indicator_block.isnull().sum().sum()
-        block_missing_rate = missing_cells / total_cells if total_cells > 0 else 0
-        
-        # 如果缺失率超过阈值，则将这些列加入待删除列表
-        if block_missing_rate > INDICATOR_DROP_THRESHOLD:
-            print(f"  - 指标 '{indicator}' 缺失率高达 {block_missing_rate:.1%}，将被从该行业数据中移除。")
-            cols_to_drop.extend(indicator_cols)
+    base_name_series = pd.Series({col: get_base_indicator_name(col) for col in data_columns})
+
+    # 各列行数相同，故整块缺失率 = 块内各列缺失率的平均，按指标分组一次算出
+    null_frac = df[data_columns].isnull().mean().groupby(base_name_series).mean()
+    drop_indicators = null_frac[null_frac > INDICATOR_DROP_THRESHOLD]
+    for indicator, block_missing_rate in drop_indicators.items():
+        print(f"  - 指标 '{indicator}' 缺失率高达 {block_missing_rate:.1%}，将被从该行业数据中移除。")
+    cols_to_drop = base_name_series[base_name_series.isin(drop_indicators.index)].index.tolist()
             
     # 一次性删除所有标记的列
     if cols_to_drop:
@@ -129,7 +120,8 @@ def main():
                 output_filename = f"{industry_name}_清洗后.xlsx"
                 output_file_path = os.path.join(output_path, output_filename)
                 
-                cleaned_df.to_excel(output_file_path, index=False)
+                cleaned_df.to_excel(output_file_path, index=False, engine='xlsxwriter')
+                save_parquet_twin(cleaned_df, output_file_path)
                 print(f"成功保存清洗后的文件到: {output_file_path}")
             else:
                 print(f"文件 {filename} 清洗后为空，不进行保存。")
@@ -1,4 +1,5 @@
 import os
+import numpy as np
 import pandas as pd
 import akshare as ak
 
@@ -19,28 +20,37 @@ target_dates = [
     '2021-12-31','2021-09-30','2021-06-30','2021-03-31',
     '2020-12-31','2020-09-30','2020-06-30','2020-03-31'
 ]
-target_dates_set = set(target_dates)
+target_dates_d = np.array(target_dates, dtype='datetime64[D]')
+
+# 是否另存全部历史日K（默认只保存目标日期筛选结果；调试需要时打开，存为parquet）
+SAVE_FULL_HISTORY = False
 
 # ------- 工具函数 --------
-def find_board_code(name: str):
+def load_board_map():
     """
-    自动用合适的akshare接口，获取同花顺行业板块代码
+    自动用合适的akshare接口，一次性取回同花顺行业板块列表，返回{名称: 代码}
     """
-    import akshare as ak
     try:
-        df = ak.ths_board_industry_listing()
+        listing = ak.ths_board_industry_listing()
     except AttributeError:
-        df = ak.stock_board_industry_name_ths()
-    row = df[df['名称'] == name]
-    if row.empty:
+        listing = ak.stock_board_industry_name_ths()
+    return dict(zip(listing['名称'], listing['代码']))
+
+_BOARD_MAP = load_board_map()
+
+def find_board_code(name: str):
+    """
+    获取同花顺行业板块代码（查模块加载时缓存的板块列表）
+    """
+    code = _BOARD_MAP.get(name)
+    if code is None:
         print(f"[WARN] 未找到板块：{name}")
-        return None
-    return row.iloc[0]['代码']
+    return code
 
 # -------- 主程序 --------
 for ind_name in industry_names:
     print(f"\n【{ind_name}】——获取板块指数行情 ...")
-    board_code = find_board_code(ind_name, board_type="industry")
+    board_code = find_board_code(ind_name)
     if not board_code:
         print(f"[WARN] {ind_name} 无法获取代码，跳过")
         continue
@@ -49,14 +59,15 @@ for ind_name in industry_names:
         df = ak.ths_index_daily(symbol=board_code)  # 全部历史日K
         if not df.empty:
             # 仅保留目标日期的记录，若你只关心特定日期
-            df['date'] = pd.to_datetime(df['日期'], errors='coerce').dt.strftime('%Y-%m-%d')
-            # 若仅需要target_dates
-            df_select = df[df['date'].isin(target_dates_set)].copy()
-            out_path = os.path.join(output_folder, f"{ind_name}_板块指数日K.xlsx")
-            df.to_excel(out_path, index=False)
-            print(f"  [INFO] 板块【{ind_name}】已保存全部日K（含所有历史日期）至：{out_path}")
+            # 若仅需要target_dates：按天精度的datetime64直接比较，只生成筛选掩码，不往表里加临时日期列
+            dates_d = pd.to_datetime(df['日期'], errors='coerce').values.astype('datetime64[D]')
+            df_select = df[np.isin(dates_d, target_dates_d)]
+            if SAVE_FULL_HISTORY:
+                out_path = os.path.join(output_folder, f"{ind_name}_板块指数日K.parquet")
+                df.to_parquet(out_path, index=False)
+                print(f"  [INFO] 板块【{ind_name}】已保存全部日K（含所有历史日期）至：{out_path}")
             out_path2 = os.path.join(output_folder, f"{ind_name}_板块指数日K_目标日期筛选.xlsx")
-            df_select.to_excel(out_path2, index=False)
+            df_select.to_excel(out_path2, index=False, engine='xlsxwriter')
             print(f"  [INFO] 板块【{ind_name}】目标交易日数据另存为：{out_path2}")
         else:
             print(f"  [WARN] 板块【{ind_name}】行情为空")
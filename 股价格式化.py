@@ -1,5 +1,8 @@
 import os
 import pandas as pd
+import xlsxwriter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from glob import glob
 
 # ==============================
@@ -9,31 +12,62 @@ raw_data_dir = '股价原始数据'
 output_data_dir = '股价整理数据'
 os.makedirs(output_data_dir, exist_ok=True)
 
+# ==============================
+# 读取原始文件（优先parquet，兼容旧版xlsx）
+# ==============================
+def list_raw_files(raw_dir):
+    files = {}
+    for path in glob(os.path.join(raw_dir, '*_股价.xlsx')) + glob(os.path.join(raw_dir, '*_股价.parquet')):
+        files[os.path.splitext(path)[0]] = path  # 同一行业两种格式都有时，parquet覆盖xlsx
+    return sorted(files.values())
+
+RAW_COLUMNS = ['trade_date', 'stock_name', 'close']  # 整理只用到这三列
+
+def read_raw_file(raw_file_path):
+    if raw_file_path.endswith('.parquet'):
+        return pd.read_parquet(raw_file_path, columns=RAW_COLUMNS)
+    try:
+        # calamine引擎（pandas>=2.2，需python-calamine）解析xlsx比openpyxl快得多
+        return pd.read_excel(raw_file_path, engine='calamine', usecols=RAW_COLUMNS, dtype={'trade_date': str})
+    except (ImportError, ValueError):  # 未安装python-calamine / 旧版pandas不认识该引擎
+        return pd.read_excel(raw_file_path, engine='openpyxl', usecols=RAW_COLUMNS, dtype={'trade_date': str})
+
+# ==============================
+# 写出整理结果：按行直接写xlsxwriter，constant_memory模式逐行落盘
+# （pandas.to_excel按列写单元格，不能配合constant_memory使用）
+# ==============================
+def write_price_sheet(pivot_df, out_path):
+    values = pivot_df.to_numpy(dtype=object)
+    values[pd.isna(values)] = None  # 缺失价格写成空单元格，与to_excel一致
+    wb = xlsxwriter.Workbook(out_path, {'constant_memory': True})
+    ws = wb.add_worksheet()
+    header_fmt = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    ws.write_row(0, 0, [str(c) for c in pivot_df.columns], header_fmt)
+    for i, row in enumerate(values, start=1):
+        ws.write_row(i, 0, row.tolist())
+    wb.close()
+
 # ==============================
 # 处理一个行业的原始文件
 # ==============================
 def process_industry_file(raw_file_path, output_dir):
-    industry = os.path.basename(raw_file_path).replace('_股价.xlsx', '')
-    df = pd.read_excel(raw_file_path, dtype={'trade_date': str})
-
-    # 获取所有股票名，确保顺序一致
-    stock_names = df['stock_name'].unique().tolist()
-    stock_names.sort()
-    
-    # 按日期、股票透视，通过"收盘价"
-    pivot_df = df.pivot_table(
-        index='trade_date',
-        columns='stock_name',
-        values='close',
-        aggfunc='first'
-    )
-
-    # 日期升序排列，并转为yyyy-mm-dd格式
-    pivot_df.index = pd.to_datetime(pivot_df.index, format='%Y%m%d').strftime('%Y-%m-%d')
-    pivot_df = pivot_df.sort_index(ascending=False)   # 最新日期在上
-
-    # 列顺序按照stock_names
-    pivot_df = pivot_df[stock_names]
+    industry = os.path.splitext(os.path.basename(raw_file_path))[0].removesuffix('_股价')
+    df = read_raw_file(raw_file_path)
+    # 股票名、日期大量重复，转为category后透视时按整数编码哈希，也更省内存
+    df['stock_name'] = df['stock_name'].astype('category')
+    df['trade_date'] = df['trade_date'].astype('category')
+
+    # 按日期、股票透视，通过"收盘价"；(日期, 股票)本应唯一，去重后直接reshape，不走pivot_table的聚合
+    df = df.drop_duplicates(['trade_date', 'stock_name'], keep='first')
+    pivot_df = df.pivot(index='trade_date', columns='stock_name', values='close')
+
+    # 股票名升序保证列顺序一致，最新日期在上
+    pivot_df = pivot_df.sort_index(axis=1).sort_index(axis=0, ascending=False)
+
+    # 日期转为yyyy-mm-dd格式
+    dates = pivot_df.index.astype(str)  # yyyymmdd直接切片拼接，省去to_datetime+strftime的往返
+    pivot_df.index = dates.str[:4] + '-' + dates.str[4:6] + '-' + dates.str[6:8]
+
     pivot_df.reset_index(inplace=True)
     pivot_df.rename(columns={'trade_date': '日期'}, inplace=True)
 
@@ -42,14 +76,17 @@ def process_industry_file(raw_file_path, output_dir):
 
     # 输出文件名
     out_path = os.path.join(output_dir, f'{industry}_股价整理.xlsx')
-    pivot_df.to_excel(out_path, index=False)
+    write_price_sheet(pivot_df, out_path)
 
 # ==============================
 # 处理目录下所有行业文件
 # ==============================
 def main():
-    for file_path in glob(os.path.join(raw_data_dir, '*_股价.xlsx')):
-        process_industry_file(file_path, output_data_dir)
+    files = list_raw_files(raw_data_dir)
+    if files:
+        # 各行业文件互不依赖，多进程并行整理
+        with ProcessPoolExecutor(max_workers=min(len(files), os.cpu_count())) as ex:
+            list(ex.map(partial(process_industry_file, output_dir=output_data_dir), files))
     print("所有行业股价数据已整理完成。")
 
 if __name__ == "__main__":
@@ -1,6 +1,18 @@
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 import tushare as ts
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import requests_cache
+except ImportError:  # 未安装时不缓存，照常联网抓取
+    requests_cache = None
 
 # 设定工作目录
 work_dir = os.path.abspath(os.curdir)
@@ -11,6 +23,57 @@ stock_folder = os.path.join(work_dir, '涉及的股票')
 price_folder = os.path.join(work_dir, '股价原始数据')
 os.makedirs(price_folder, exist_ok=True)
 
+# 并发抓取的线程数，以及每分钟最多请求次数（按自己账号积分对应的频率上限调整）
+MAX_WORKERS = 8
+MAX_CALLS_PER_MINUTE = 200
+
+_rate_lock = threading.Lock()
+_next_call_time = 0.0
+
+def wait_for_rate_limit():
+    """
+    多线程共享的限速：相邻两次请求至少间隔 60/MAX_CALLS_PER_MINUTE 秒
+    """
+    global _next_call_time
+    with _rate_lock:
+        now = time.monotonic()
+        wait = _next_call_time - now
+        _next_call_time = max(now, _next_call_time) + 60 / MAX_CALLS_PER_MINUTE
+    if wait > 0:
+        time.sleep(wait)
+
+# tushare接口走requests的POST请求：网络抖动、5xx、429在HTTP层自动退避重试，并只对真正发出的请求限速；
+# 装了requests_cache时另用本地sqlite缓存一天内的成功返回，重跑时命中缓存既不联网也不等待
+class RateLimitedAdapter(HTTPAdapter):
+    """缓存命中的请求不会走到adapter，只有真正发往服务器的请求才限速"""
+    def send(self, request, **kwargs):
+        wait_for_rate_limit()
+        return super().send(request, **kwargs)
+
+def _tushare_ok(response):
+    """只缓存成功的返回（tushare限频等错误同样是HTTP 200，不能缓存）"""
+    try:
+        return response.json().get('code') == 0
+    except ValueError:
+        return False
+
+class RetrySession(requests_cache.CachedSession if requests_cache is not None else requests.Session):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=None)  # tushare全部是POST，默认不重试POST
+        self.mount('http://', RateLimitedAdapter(max_retries=retry))
+        self.mount('https://', RateLimitedAdapter(max_retries=retry))
+
+if requests_cache is not None:
+    requests_cache.install_cache('tushare_cache', backend='sqlite', expire_after=86400,
+                                 allowable_methods=('GET', 'POST'), filter_fn=_tushare_ok,
+                                 session_factory=RetrySession)
+else:
+    print("[INFO] 未安装requests_cache，本次不缓存tushare请求")
+    # tushare内部用requests.post，每次新建Session；替换默认Session类，重试和限速照样生效
+    requests.Session = requests.sessions.Session = RetrySession
+
 # tushare初始化
 ts.set_token('1770cab9e56c81e69e188f6ff930d3060d79a6db63bca59dcf7c3f65')  # 替换为你的tushare token
 pro = ts.pro_api()
@@ -24,24 +87,57 @@ target_dates = [
     '2020-12-31', '2020-09-30', '2020-06-30', '2020-03-31'
 ]
 
+# 交易日历只取一次，存为升序的datetime64[D]数组，供二分查找
+trade_cal = pro.trade_cal(exchange='SSE', start_date='20200101', end_date='20251231')
+trade_days = np.sort(pd.to_datetime(trade_cal[trade_cal['is_open']==1]['cal_date'], format='%Y%m%d').values.astype('datetime64[D]'))
+
 # 转换为交易所格式日历日期
 def find_trade_date(date_str):
     """
     对于不是交易日的日期，向前寻找最近交易日
     """
-    trade_cal = pro.trade_cal(exchange='SSE', start_date='20200101', end_date='20251231')
-    trade_cal = trade_cal[trade_cal['is_open']==1]['cal_date'].sort_values()
-    date = pd.to_datetime(date_str)
-    trade_dates = pd.to_datetime(trade_cal.values)
-    date_use = trade_dates[trade_dates <= date].max()
-    return date_use.strftime('%Y%m%d')
+    idx = np.searchsorted(trade_days, np.datetime64(date_str, 'D'), side='right') - 1
+    if idx < 0:
+        raise ValueError(f"{date_str} 早于交易日历起点 {pd.Timestamp(trade_days[0]).date()}，请调整trade_cal的start_date")
+    return pd.Timestamp(trade_days[idx]).strftime('%Y%m%d')
 
 target_trade_dates = [find_trade_date(d) for d in target_dates]
+target_trade_date_set = set(target_trade_dates)
+start_date, end_date = min(target_trade_dates), max(target_trade_dates)
+
+def fetch_daily(ts_code, max_retries=3):
+    """
+    按日期区间一次取回单只股票的全部日线（代替逐日请求），
+    出错时（多为接口频率限制）按指数退避重试
+    """
+    for attempt in range(max_retries):
+        try:
+            return pro.daily(ts_code=ts_code, start_date=start_date, end_date=end_date)
+        except Exception:
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+def fetch_one(stock_name, ts_code):
+    """
+    抓取单只股票区间内的日线，出错时返回None
+    """
+    try:
+        return fetch_daily(ts_code)
+    except Exception as e:
+        print(f"[ERROR] 抓取 {ts_code} {stock_name} 异常: {e}")
+        return None
 
 # 准备股票代码查找（名称->代码）
-def get_stock_code_map():
-    # 取全市场A股
-    stocks = pro.stock_basic(exchange='', list_status='L', fields='ts_code,name')
+stock_code_cache = os.path.join(work_dir, 'stock_name2code.parquet')
+
+def get_stock_code_map(max_age=86400):
+    # 取全市场A股；本地缓存一天内有效，过期才重新请求stock_basic
+    if os.path.exists(stock_code_cache) and time.time() - os.path.getmtime(stock_code_cache) < max_age:
+        stocks = pd.read_parquet(stock_code_cache)
+    else:
+        stocks = pro.stock_basic(exchange='', list_status='L', fields='ts_code,name')
+        stocks.to_parquet(stock_code_cache, index=False)
     return dict(zip(stocks['name'], stocks['ts_code']))
 
 stock_name2code = get_stock_code_map()
@@ -52,28 +148,35 @@ for fname in os.listdir(stock_folder):
         industry = fname.split('_')[0]
         fpath = os.path.join(stock_folder, fname)
         df = pd.read_excel(fpath)
-        result = []
-        # 对每个股票逐个查找
-        for idx, row in df.iterrows():
-            stock_name = str(row['证券名称'])
-            ts_code = stock_name2code.get(stock_name)
-            if not ts_code:
-                print(f"[WARN] 找不到股票代码: {stock_name}")
-                continue
-            for d in target_trade_dates:
-                try:
-                    price_df = pro.daily(ts_code=ts_code, trade_date=d)
-                    if not price_df.empty:
-                        price_df['industry'] = industry
-                        price_df['stock_name'] = stock_name
-                        result.append(price_df)
-                except Exception as e:
-                    print(f"[ERROR] 抓取 {ts_code} {stock_name} {d} 异常: {e}")
+        # 名称 -> 代码一次性映射，找不到代码的先统一提示
+        names = df['证券名称'].astype(str)
+        codes = names.map(stock_name2code)
+        for stock_name in names[codes.isna()]:
+            print(f"[WARN] 找不到股票代码: {stock_name}")
+        result = {}
+        # 各股票的请求都是网络IO，用线程池并发抓取，频率由wait_for_rate_limit统一控制
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {executor.submit(fetch_one, stock_name, ts_code): stock_name
+                       for stock_name, ts_code in zip(names[codes.notna()], codes.dropna())}
+            for future in as_completed(futures):
+                price_df = future.result()
+                if price_df is not None:
+                    result[futures[future]] = price_df
 
+        price_res = pd.DataFrame()
         if result:
-            price_res = pd.concat(result, ignore_index=True)
-            out_path = os.path.join(price_folder, f"{industry}_股价.xlsx")
-            price_res.to_excel(out_path, index=False)
+            # 每只股票一张区间大表，整个行业只concat一次，再统一筛选目标交易日、补上行业和股票名
+            price_res = pd.concat(result, names=['stock_name', None])
+            price_res = price_res[price_res['trade_date'].isin(target_trade_date_set)]
+            price_res = price_res.assign(
+                industry=industry,
+                stock_name=price_res.index.get_level_values('stock_name')
+            ).reset_index(drop=True)
+
+        if not price_res.empty:
+            # 原始股价只供股价格式化.py读取，存为parquet，省去xlsx的XML/ZIP开销
+            out_path = os.path.join(price_folder, f"{industry}_股价.parquet")
+            price_res.to_parquet(out_path, index=False)
             print(f"[INFO] {industry} 行业股价已保存至 {out_path}")
         else:
             print(f"[INFO] {industry} 行业没有抓到有效数据")